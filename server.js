@@ -1,33 +1,120 @@
 const WebSocket = require('ws');
 const { v4: uuid } = require('uuid');
 
-const wss = new WebSocket.Server({ port: 8080 });
+const PORT = Number(process.env.PORT) || 8080;
+const wss = new WebSocket.Server({ port: PORT });
 
-const grid = {}; // { cellId: { value, lastUpdated, lastUpdatedBy } }
+const DEFAULT_ROWS = 100;
+const DEFAULT_COLS = 26;
+const HEARTBEAT_INTERVAL_MS = 30000;
+const CELL_UPDATE_FLUSH_MS = 16;
+
+// Cell state as parallel row-major arrays rather than one object per cell:
+// grid.values[row][col], grid.lastUpdated[row][col], grid.lastUpdatedBy[row][col]
+const grid = { values: [], lastUpdated: [], lastUpdatedBy: [] };
+const gridSize = { rows: 0, cols: 0 };
 const clients = {}; // { connectionId: { ws, userId, position, name } }
 
-console.log('WebSocket server running on ws://localhost:8080');
+// Serialized 'full-grid' message shared by every new connection; rebuilt
+// lazily after the grid changes instead of on each connect.
+let fullGridMessage = null;
 
-function ensureGridSize(minRows = 100, minCols = 26) {
-  let maxRow = -1, maxCol = -1;
-  Object.keys(grid).forEach(cellId => {
-    const [r, c] = cellId.split('-').map(Number);
-    if (r > maxRow) maxRow = r;
-    if (c > maxCol) maxCol = c;
-  });
-  
-  for (let r = 0; r < Math.max(minRows, maxRow + 1); r++) {
-    for (let c = 0; c < Math.max(minCols, maxCol + 1); c++) {
-      const cellId = `${r}-${c}`;
-      if (!grid[cellId]) {
-        grid[cellId] = { 
-          value: '', 
-          lastUpdated: Date.now(),
-          lastUpdatedBy: null
-        };
-      }
-    }
+// Cell updates waiting to be broadcast, keyed by canonical cellId so a burst
+// of edits to the same cell goes out once with its latest value.
+const pendingCellUpdates = new Map();
+let cellUpdateTimer = null;
+
+console.log(`WebSocket server running on ws://localhost:${PORT}`);
+
+function appendRow(updatedBy) {
+  const now = Date.now();
+  grid.values.push(new Array(gridSize.cols).fill(''));
+  grid.lastUpdated.push(new Array(gridSize.cols).fill(now));
+  grid.lastUpdatedBy.push(new Array(gridSize.cols).fill(updatedBy));
+  gridSize.rows += 1;
+}
+
+function removeLastRow() {
+  grid.values.pop();
+  grid.lastUpdated.pop();
+  grid.lastUpdatedBy.pop();
+  gridSize.rows -= 1;
+}
+
+// Fills the empty grid once at startup; row/column handlers keep gridSize
+// current from then on.
+function seedGrid(rows = DEFAULT_ROWS, cols = DEFAULT_COLS) {
+  gridSize.cols = cols;
+  for (let r = 0; r < rows; r++) {
+    appendRow(null);
+  }
+}
+
+const CELL_ID_RE = /^(\d+)-(\d+)$/;
+
+// Maps a client cellId ("row-col") to integer array indices plus the
+// canonical id for that cell, or null if it is malformed or outside the grid.
+// Callers use the returned cellId rather than the client's string, so that
+// spellings like "01-2" can't stand in for "1-2".
+function parseCellId(cellId) {
+  const match = CELL_ID_RE.exec(cellId);
+  if (!match) return null;
+  const row = Number(match[1]);
+  const col = Number(match[2]);
+  if (row >= gridSize.rows || col >= gridSize.cols) return null;
+  return { row, col, cellId: `${row}-${col}` };
+}
+
+seedGrid();
+
+function invalidateGridSnapshot() {
+  fullGridMessage = null;
+}
+
+function getFullGridMessage() {
+  if (!fullGridMessage) {
+    // Clients only read values, and empty cells are implied by the dimensions
+    const cells = {};
+    grid.values.forEach((rowValues, r) => {
+      rowValues.forEach((value, c) => {
+        if (value !== '') cells[`${r}-${c}`] = value;
+      });
+    });
+    fullGridMessage = JSON.stringify({ 
+      type: 'full-grid', 
+      cells,
+      rows: gridSize.rows,
+      cols: gridSize.cols,
+      timestamp: Date.now()
+    });
   }
+  return fullGridMessage;
+}
+
+// An edit that arrives while no flush window is open goes out immediately
+// and opens one; edits arriving inside the window are coalesced into one
+// 'cell-updates' message when it closes. A burst of keystrokes or a
+// multi-cell change then costs clients one re-render and one recalculation
+// instead of one per edit, while an isolated edit isn't delayed. Structural
+// changes flush the queue first, so clients never receive an edit after the
+// row it belongs to has been removed.
+function queueCellUpdate(update) {
+  pendingCellUpdates.set(update.cellId, update);
+  if (!cellUpdateTimer) flushCellUpdates();
+}
+
+function flushCellUpdates() {
+  clearTimeout(cellUpdateTimer);
+  cellUpdateTimer = null;
+  if (pendingCellUpdates.size === 0) return;
+  const updates = [...pendingCellUpdates.values()];
+  pendingCellUpdates.clear();
+  broadcast({ 
+    type: 'cell-updates', 
+    updates,
+    timestamp: Date.now()
+  });
+  cellUpdateTimer = setTimeout(flushCellUpdates, CELL_UPDATE_FLUSH_MS);
 }
 
 function broadcastUserList() {
@@ -60,6 +147,11 @@ wss.on('connection', (ws) => {
 
   console.log(`[Connected] ${connectionId}`);
 
+  ws.isAlive = true;
+  ws.on('pong', () => {
+    ws.isAlive = true;
+  });
+
   // Send initialization data
   ws.send(JSON.stringify({ 
     type: 'init', 
@@ -67,12 +159,7 @@ wss.on('connection', (ws) => {
     color: userColor
   }));
 
-  ensureGridSize();
-  ws.send(JSON.stringify({ 
-    type: 'full-grid', 
-    grid,
-    timestamp: Date.now()
-  }));
+  ws.send(getFullGridMessage());
 
   broadcastUserList();
 
@@ -97,6 +184,21 @@ wss.on('connection', (ws) => {
   });
 });
 
+// Keep connections alive through idle proxies, and drop peers that stopped
+// answering pings so broadcasts aren't serialized and queued for dead sockets.
+const heartbeat = setInterval(() => {
+  wss.clients.forEach(ws => {
+    if (!ws.isAlive) {
+      ws.terminate();
+      return;
+    }
+    ws.isAlive = false;
+    ws.ping();
+  });
+}, HEARTBEAT_INTERVAL_MS);
+
+wss.on('close', () => clearInterval(heartbeat));
+
 function handleMessage(senderId, message) {
   switch (message.type) {
     case 'set-name':
@@ -105,24 +207,31 @@ function handleMessage(senderId, message) {
       break;
 
     case 'cell-edit': {
-      const { cellId, value } = message;
-      const currentCell = grid[cellId];
+      const { value } = message;
+      const pos = parseCellId(message.cellId);
+      if (!pos) break;
+      const { row, col, cellId } = pos;
       
       // Conflict resolution: last write wins
-      if (!currentCell || message.timestamp >= (currentCell.lastUpdated || 0)) {
-        grid[cellId] = { 
-          value, 
-          lastUpdated: message.timestamp || Date.now(),
-          lastUpdatedBy: senderId
-        };
+      if (message.timestamp >= grid.lastUpdated[row][col]) {
+        const timestamp = message.timestamp || Date.now();
+        const changed = grid.values[row][col] !== value;
+
+        grid.values[row][col] = value;
+        grid.lastUpdated[row][col] = timestamp;
+        grid.lastUpdatedBy[row][col] = senderId;
         
-        broadcast({ 
-          type: 'cell-update', 
-          cellId,
-          value,
-          lastUpdatedBy: senderId,
-          timestamp: message.timestamp || Date.now()
-        });
+        // An unchanged value would only make every client re-render and
+        // recalculate for nothing, and the snapshot holds only values
+        if (changed) {
+          invalidateGridSnapshot();
+          queueCellUpdate({ 
+            cellId,
+            value,
+            lastUpdatedBy: senderId,
+            timestamp
+          });
+        }
       }
       break;
     }
@@ -139,23 +248,12 @@ function handleMessage(senderId, message) {
     }
 
     case 'add-row': {
-      const colCount = Object.keys(grid).reduce((max, cellId) => {
-        const col = parseInt(cellId.split('-')[1], 10);
-        return Math.max(max, col);
-      }, 25) + 1;
+      flushCellUpdates();
+      const colCount = gridSize.cols;
+      const newRowIdx = gridSize.rows;
       
-      const newRowIdx = Object.keys(grid).reduce((max, cellId) => {
-        const row = parseInt(cellId.split('-')[0], 10);
-        return Math.max(max, row);
-      }, 99) + 1;
-      
-      for (let c = 0; c < colCount; c++) {
-        grid[`${newRowIdx}-${c}`] = { 
-          value: '', 
-          lastUpdated: Date.now(),
-          lastUpdatedBy: senderId
-        };
-      }
+      appendRow(senderId);
+      invalidateGridSnapshot();
       
       broadcast({ 
         type: 'row-added', 
@@ -167,14 +265,12 @@ function handleMessage(senderId, message) {
     }
 
     case 'delete-row': {
-      const rowToDelete = Object.keys(grid).reduce((max, cellId) => {
-        const row = parseInt(cellId.split('-')[0], 10);
-        return Math.max(max, row);
-      }, 99);
+      flushCellUpdates();
+      if (gridSize.rows <= 1) break;
+      const rowToDelete = gridSize.rows - 1;
       
-      for (let c = 0; c < COLS; c++) {
-        delete grid[`${rowToDelete}-${c}`];
-      }
+      removeLastRow();
+      invalidateGridSnapshot();
       
       broadcast({ 
         type: 'row-deleted', 
@@ -1,15 +1,25 @@
 import React, { useState, useEffect, useRef } from 'react';
+import {
+    buildDependencyIndex,
+    columnLabel,
+    computeDisplayValues,
+    createDependencyIndex,
+    recalculate,
+    setCellDependencies
+} from '../utils/formula';
 
 // Constants
 const COLS = 26;
 const ROWS = 100;
-const colHeaders = Array.from({ length: COLS }, (_, i) => String.fromCharCode(65 + i));
+const WS_URL = process.env.REACT_APP_WS_URL || 'ws://localhost:8080';
 const USER_COLORS = [
     '#FF5252', '#FF4081', '#E040FB', '#7C4DFF', '#536DFE',
     '#448AFF', '#40C4FF', '#18FFFF', '#64FFDA', '#69F0AE',
     '#B2FF59', '#EEFF41', '#FFFF00', '#FFD740', '#FFAB40'
 ];
 
+const DATE_RE = /^\d{4}-\d{2}-\d{2}$/;
+
 // Helper functions
 const getCellId = (row, col) => `${row}-${col}`;
 
@@ -19,7 +29,7 @@ const getCellPosFromId = (cellId) => {
 };
 
 const isValidDate = (str) => {
-    if (!/^\d{4}-\d{2}-\d{2}$/.test(str)) return false;
+    if (!DATE_RE.test(str)) return false;
     const [year, month, day] = str.split('-').map(Number);
     if (month < 1 || month > 12) return false;
     if (day < 1 || day > 31) return false;
@@ -31,70 +41,6 @@ const isValidDate = (str) => {
     );
 };
 
-const cellRefToIndex = (ref) => {
-    const match = ref.match(/^([A-Z]+)(\d+)$/);
-    if (!match) return null;
-    let col = 0;
-    for (let i = 0; i < match[1].length; i++) {
-        col = col * 26 + (match[1].charCodeAt(i) - 65 + 1);
-    }
-    col -= 1;
-    const row = parseInt(match[2], 10) - 1;
-    return { row, col };
-};
-
-const getRangeValues = (range, getCellValue) => {
-    const match = range.match(/^([A-Z]+\d+):([A-Z]+\d+)$/);
-    if (!match) return [];
-    const start = cellRefToIndex(match[1]);
-    const end = cellRefToIndex(match[2]);
-    if (!start || !end) return [];
-    const values = [];
-    for (let r = Math.min(start.row, end.row); r <= Math.max(start.row, end.row); r++) {
-        for (let c = Math.min(start.col, end.col); c <= Math.max(start.col, end.col); c++) {
-            values.push(getCellValue(r, c));
-        }
-    }
-    return values;
-};
-
-const evaluateFormula = (formula, getCellValue) => {
-    formula = formula.replace(/(SUM|AVG|COUNT)\(([^)]+)\)/gi, (match, fn, arg) => {
-        const values = getRangeValues(arg.trim(), getCellValue);
-        if (fn.toUpperCase() === 'SUM') {
-            return values.reduce((acc, v) => acc + (parseFloat(v) || 0), 0);
-        } else if (fn.toUpperCase() === 'AVG') {
-            const nums = values.map(v => parseFloat(v)).filter(v => !isNaN(v));
-            return nums.length ? nums.reduce((a, b) => a + b, 0) / nums.length : 0;
-        } else if (fn.toUpperCase() === 'COUNT') {
-            return values.filter(v => v !== undefined && v !== null && v !== '').length;
-        }
-        return 0;
-    });
-
-    let expr = formula.replace(/([A-Z]+\d+)/g, (ref) => {
-        const idx = cellRefToIndex(ref);
-        if (!idx) return '0';
-        const val = getCellValue(idx.row, idx.col);
-        if (typeof val === 'string' && val.startsWith('=')) {
-            try {
-                return evaluateFormula(val.slice(1), getCellValue);
-            } catch {
-                return '0';
-            }
-        }
-        return val === undefined || val === null || val === '' ? '0' : isNaN(Number(val)) ? '0' : Number(val);
-    });
-
-    if (/[^0-9+\-*/(). ]/.test(expr)) return '#ERR';
-    try {
-        // eslint-disable-next-line no-eval
-        return eval(expr);
-    } catch {
-        return '#ERR';
-    }
-};
-
 function Grid() {
     // State
     const [gridData, setGridData] = useState(
@@ -114,27 +60,25 @@ function Grid() {
 
     // Refs
     const cellRefs = useRef({});
+    // Which formula cells read which cells; kept in step with gridData so an
+    // edit only recalculates its dependents.
+    const dependencyIndex = useRef(createDependencyIndex());
+    // The latest grid, including changes React hasn't rendered yet. Socket
+    // messages build the next grid from it and update the index alongside,
+    // so setGridData only ever receives a finished value and no state
+    // updater has side effects.
+    const latestGrid = useRef(gridData);
 
     // Helper functions
-    const getCellValue = (row, col) => {
-        if (row < 0 || row >= gridData.length || col < 0 || col >= (gridData[0]?.length || 0)) {
-            return '';
-        }
-        return gridData[row][col]?.value || '';
+    const commitGrid = (grid) => {
+        latestGrid.current = grid;
+        setGridData(grid);
     };
 
-    // Derived state
-    const displayGrid = gridData.map((row, rowIdx) =>
-        row.map((cell, colIdx) => {
-            const val = cell.value;
-            if (typeof val === 'string' && val.startsWith('=') &&
-                !(editingCell?.row === rowIdx && editingCell?.col === colIdx)) {
-                const result = evaluateFormula(val.slice(1), (r, c) => getCellValue(r, c));
-                return { ...cell, display: result };
-            }
-            return { ...cell, display: val };
-        })
-    );
+    const rebuildFormulas = (grid) => {
+        dependencyIndex.current = buildDependencyIndex(grid);
+        return computeDisplayValues(grid, dependencyIndex.current);
+    };
 
     const updateUserPresence = (users) => {
         const usersObj = {};
@@ -153,40 +97,56 @@ function Grid() {
         setUserColors(colors);
     };
 
-    const handleRemoteCellUpdate = (msg) => {
-        const { row, col } = getCellPosFromId(msg.cellId);
-
-        setGridData(prev => {
-            const newGrid = [...prev];
-            if (!newGrid[row]) newGrid[row] = [];
-            if (!newGrid[row][col]) newGrid[row][col] = { value: '' };
+    // Applies a batch of remote edits with one state update and one
+    // recalculation over all of the changed cells. Edits to cells outside
+    // the current grid are dropped rather than growing phantom rows.
+    const handleRemoteCellUpdates = (updates) => {
+        const positions = updates.map(update => getCellPosFromId(update.cellId));
+
+        const prev = latestGrid.current;
+        const newGrid = [...prev];
+        const copiedRows = new Set();
+        const applied = [];
+        updates.forEach((update, i) => {
+            const { row, col } = positions[i];
+            if (!(col >= 0 && col < prev[row]?.length)) return;
+            if (!copiedRows.has(row)) {
+                newGrid[row] = [...newGrid[row]];
+                copiedRows.add(row);
+            }
             newGrid[row][col] = {
                 ...newGrid[row][col],
-                value: msg.value,
-                lastUpdatedBy: msg.lastUpdatedBy
+                value: update.value,
+                lastUpdatedBy: update.lastUpdatedBy
             };
-            return newGrid;
+            setCellDependencies(dependencyIndex.current, row, col, update.value);
+            applied.push(positions[i]);
         });
+        if (applied.length) commitGrid(recalculate(newGrid, dependencyIndex.current, applied));
 
-        setLastUpdatedCells(prev => ({
-            ...prev,
-            [msg.cellId]: Date.now()
-        }));
+        const now = Date.now();
+        setLastUpdatedCells(prev => {
+            const newState = { ...prev };
+            updates.forEach(update => {
+                newState[update.cellId] = now;
+            });
+            return newState;
+        });
 
         setTimeout(() => {
             setLastUpdatedCells(prev => {
                 const newState = { ...prev };
-                delete newState[msg.cellId];
+                updates.forEach(update => {
+                    delete newState[update.cellId];
+                });
                 return newState;
             });
         }, 1000);
     };
 
     const handleRowAdded = (msg) => {
-        setGridData(prev => {
-            const newRow = Array.from({ length: msg.colCount }, () => ({ value: '' }));
-            return [...prev, newRow];
-        });
+        const newRow = Array.from({ length: msg.colCount }, () => ({ value: '' }));
+        commitGrid([...latestGrid.current, newRow]);
     };
 
     const handleSetName = () => {
@@ -236,7 +196,7 @@ function Grid() {
 
     // WebSocket connection
     useEffect(() => {
-        const socket = new WebSocket('ws://localhost:8080');
+        const socket = new WebSocket(WS_URL);
         setWs(socket);
 
         socket.onmessage = (event) => {
@@ -253,8 +213,8 @@ function Grid() {
                         updateUserPresence(msg.users);
                         break;
 
-                    case 'cell-update':
-                        handleRemoteCellUpdate(msg);
+                    case 'cell-updates':
+                        handleRemoteCellUpdates(msg.updates);
                         break;
 
                     case 'user-position-update':
@@ -272,42 +232,29 @@ function Grid() {
                         break;
 
                     case 'row-deleted':
-                        setGridData(prev => prev.slice(0, -1));
+                        commitGrid(rebuildFormulas(latestGrid.current.slice(0, -1)));
                         break;
 
                     case 'col-added':
-                        setGridData(prev => prev.map(row => [...row, { value: '' }]));
+                        commitGrid(latestGrid.current.map(row => [...row, { value: '' }]));
                         break;
 
                     case 'col-deleted':
-                        setGridData(prev => prev.map(row => row.slice(0, -1)));
+                        commitGrid(rebuildFormulas(latestGrid.current.map(row => row.slice(0, -1))));
                         break;
 
-                    case 'full-grid':
-                        const keys = Object.keys(msg.grid);
-                        if (keys.length === 0) {
-                            setGridData(Array.from({ length: ROWS }, () =>
-                                Array.from({ length: COLS }, () => ({ value: '' }))
-                            ));
-                        } else {
-                            let maxRow = 0, maxCol = 0;
-                            keys.forEach(cellId => {
-                                const [r, c] = cellId.split('-').map(Number);
-                                if (r > maxRow) maxRow = r;
-                                if (c > maxCol) maxCol = c;
-                            });
-                            const newGrid = [];
-                            for (let r = 0; r <= maxRow; r++) {
-                                const row = [];
-                                for (let c = 0; c <= maxCol; c++) {
-                                    const cell = msg.grid[`${r}-${c}`];
-                                    row.push(cell ? { value: cell.value } : { value: '' });
-                                }
-                                newGrid.push(row);
-                            }
-                            setGridData(newGrid);
-                        }
+                    case 'full-grid': {
+                        // The server sends its dimensions, so the grid is built in one
+                        // pass instead of parsing every cell id to find them first
+                        const { rows, cols } = msg;
+                        const newGrid = Array.from({ length: rows }, (_, r) =>
+                            Array.from({ length: cols }, (_, c) => ({
+                                value: msg.cells[`${r}-${c}`] ?? ''
+                            }))
+                        );
+                        commitGrid(rebuildFormulas(newGrid));
                         break;
+                    }
                 }
             } catch (e) {
                 console.error('Error processing message:', e);
@@ -392,7 +339,7 @@ function Grid() {
             >
                 <input
                     ref={el => (cellRefs.current[cellKey] = el)}
-                    value={isEditing ? cellValue : displayGrid[rowIdx][colIdx].display}
+                    value={isEditing ? cellValue : gridData[rowIdx]?.[colIdx]?.display ?? cellValue}
                     onChange={(e) => handleCellEdit(rowIdx, colIdx, e.target.value)}
                     onFocus={() => {
                         setSelectedCell({ row: rowIdx, col: colIdx });
@@ -580,9 +527,9 @@ function Grid() {
                     <thead>
                         <tr>
                             <th style={headerCellStyle}></th>
-                            {colHeaders.map((letter, colIdx) => (
+                            {(gridData[0] || []).map((_, colIdx) => (
                                 <th key={colIdx} style={headerCellStyle}>
-                                    {letter}
+                                    {columnLabel(colIdx)}
                                 </th>
                             ))}
                         </tr>
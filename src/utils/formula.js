@@ -0,0 +1,559 @@
+// Formula engine: cell reference parsing and evaluation of `=...` cells.
+
+// Formula patterns, compiled once instead of on every evaluation
+const CELL_RE = /^([A-Z]+)(\d+)$/;
+
+// Refs come from a small alphabet (A1..Z100 for the default grid), so parsed
+// results are cached; entries are frozen because callers share them.
+const CELL_REF_CACHE_LIMIT = 65536;
+const cellRefCache = new Map();
+
+export const cellRefToIndex = (ref) => {
+    const cached = cellRefCache.get(ref);
+    if (cached !== undefined) return cached;
+    const match = CELL_RE.exec(ref);
+    let result = null;
+    if (match) {
+        let col = 0;
+        for (let i = 0; i < match[1].length; i++) {
+            col = col * 26 + (match[1].charCodeAt(i) - 65 + 1);
+        }
+        col -= 1;
+        const row = parseInt(match[2], 10) - 1;
+        result = Object.freeze({ row, col });
+    }
+    if (cellRefCache.size >= CELL_REF_CACHE_LIMIT) cellRefCache.clear();
+    cellRefCache.set(ref, result);
+    return result;
+};
+
+// Dependency keys pack a cell into one integer (see cellKey), so formulas
+// may only reference columns below KEY_STRIDE and rows that keep the key a
+// safe integer; anything else would alias another cell.
+const KEY_STRIDE = 1 << 20;
+const MAX_ROWS = Math.floor(Number.MAX_SAFE_INTEGER / KEY_STRIDE);
+
+// Column labels A..ZZ are built once at load; wider grids extend the table
+// on demand, so a label is always a single array lookup.
+const PRECOMPUTED_COLUMNS = 26 + 26 * 26;
+const columnLabels = [];
+
+const toColumnLetters = (index) => {
+    let n = index + 1;
+    let letters = '';
+    while (n > 0) {
+        const rem = (n - 1) % 26;
+        letters = String.fromCharCode(65 + rem) + letters;
+        n = Math.floor((n - 1) / 26);
+    }
+    return letters;
+};
+
+export const columnLabel = (index) => {
+    while (columnLabels.length <= index) columnLabels.push(toColumnLetters(columnLabels.length));
+    return columnLabels[index];
+};
+
+columnLabel(PRECOMPUTED_COLUMNS - 1);
+
+// Formulas are parsed straight from their text into a small tree (numbers,
+// cell refs, SUM/AVG/COUNT over a range, + - * / and unary minus) and walked
+// against the grid; nothing is substituted back into text or handed to
+// eval(). Parsed trees are cached by formula text.
+const OPS = {
+    '+': (a, b) => a + b,
+    '-': (a, b) => a - b,
+    '*': (a, b) => a * b,
+    '/': (a, b) => a / b
+};
+
+const FUNCTIONS = new Set(['SUM', 'AVG', 'COUNT']);
+
+const ERROR = '#ERR';
+
+const FORMULA_CACHE_LIMIT = 4096;
+const formulaCache = new Map();
+
+// One sticky pattern for every token: a number, a name (function or cell
+// ref), or an operator/punctuation character. Input is uppercased once up
+// front, so names only need to match A-Z.
+const TOKEN_RE = /\s*(?:([0-9.]+)|([A-Z]+)(\d*)|([-+*/():]))/y;
+
+const isFormula = (value) => typeof value === 'string' && value.startsWith('=');
+
+const tokenize = (src) => {
+    const tokens = [];
+    const text = src.trimEnd().toUpperCase();
+    TOKEN_RE.lastIndex = 0;
+    while (TOKEN_RE.lastIndex < text.length) {
+        const start = TOKEN_RE.lastIndex;
+        const match = TOKEN_RE.exec(text);
+        if (!match) throw new SyntaxError(`Unexpected character at ${start}`);
+        const [, number, letters, digits, punct] = match;
+        if (number !== undefined) {
+            const value = Number(number);
+            if (number === '.' || Number.isNaN(value)) throw new SyntaxError(`Bad number: ${number}`);
+            tokens.push({ type: 'num', value });
+        } else if (letters !== undefined) {
+            if (!digits && text[TOKEN_RE.lastIndex] === '(' && FUNCTIONS.has(letters)) {
+                tokens.push({ type: 'fn', name: letters });
+            } else {
+                const idx = cellRefToIndex(letters + digits);
+                if (!idx) throw new SyntaxError(`Unknown name: ${letters + digits}`);
+                if (idx.row < 0 || idx.row >= MAX_ROWS || idx.col >= KEY_STRIDE) {
+                    throw new SyntaxError(`Cell ref out of range: ${letters + digits}`);
+                }
+                tokens.push({ type: 'ref', row: idx.row, col: idx.col });
+            }
+        } else {
+            tokens.push({ type: punct });
+        }
+    }
+    return tokens;
+};
+
+// Constant sub-expressions are folded while parsing, so e.g. `A1*(60*60)`
+// is cached as a single multiplication.
+const makeBinary = (op, left, right) => (
+    left.type === 'num' && right.type === 'num'
+        ? { type: 'num', value: OPS[op](left.value, right.value) }
+        : { type: 'bin', op, left, right }
+);
+
+const makeNegation = (arg) => (
+    arg.type === 'num' ? { type: 'num', value: -arg.value } : { type: 'neg', arg }
+);
+
+const parseFormula = (formula) => {
+    const tokens = tokenize(formula);
+    let pos = 0;
+
+    const peek = (offset = 0) => tokens[pos + offset]?.type;
+
+    // Aggregates take a single A1:B2 range; any other argument evaluates to 0
+    const parseFunction = (name) => {
+        if (tokens[pos++]?.type !== '(') throw new SyntaxError('Missing (');
+        if (peek() === 'ref' && peek(1) === ':' && peek(2) === 'ref' && peek(3) === ')') {
+            const start = tokens[pos];
+            const end = tokens[pos + 2];
+            pos += 4;
+            return {
+                type: 'fn',
+                name,
+                range: {
+                    minRow: Math.min(start.row, end.row),
+                    maxRow: Math.max(start.row, end.row),
+                    minCol: Math.min(start.col, end.col),
+                    maxCol: Math.max(start.col, end.col)
+                }
+            };
+        }
+        if (peek() === ')') throw new SyntaxError(`${name} needs a range`);
+        while (pos < tokens.length && peek() !== ')') pos++;
+        if (tokens[pos++]?.type !== ')') throw new SyntaxError('Missing )');
+        return { type: 'fn', name, range: null };
+    };
+
+    const parsePrimary = () => {
+        const token = tokens[pos++];
+        if (!token) throw new SyntaxError('Unexpected end of formula');
+        if (token.type === 'num' || token.type === 'ref') return token;
+        if (token.type === 'fn') return parseFunction(token.name);
+        if (token.type === '(') {
+            const node = parseSum();
+            if (tokens[pos++]?.type !== ')') throw new SyntaxError('Missing )');
+            return node;
+        }
+        throw new SyntaxError(`Unexpected token: ${token.type}`);
+    };
+
+    const parseUnary = () => {
+        if (peek() === '-' || peek() === '+') {
+            const op = tokens[pos++].type;
+            const arg = parseUnary();
+            return op === '-' ? makeNegation(arg) : arg;
+        }
+        return parsePrimary();
+    };
+
+    const parseProduct = () => {
+        let node = parseUnary();
+        while (peek() === '*' || peek() === '/') {
+            const op = tokens[pos++].type;
+            node = makeBinary(op, node, parseUnary());
+        }
+        return node;
+    };
+
+    const parseSum = () => {
+        let node = parseProduct();
+        while (peek() === '+' || peek() === '-') {
+            const op = tokens[pos++].type;
+            node = makeBinary(op, node, parseProduct());
+        }
+        return node;
+    };
+
+    const tree = parseSum();
+    if (pos !== tokens.length) throw new SyntaxError(`Unexpected token: ${peek()}`);
+    return tree;
+};
+
+// Cache entry per formula text: the parsed tree (null when the formula
+// doesn't parse, so a broken formula isn't re-tokenized on every pass) and,
+// once asked for, its precedents.
+const getFormulaEntry = (formula) => {
+    let entry = formulaCache.get(formula);
+    if (!entry) {
+        try {
+            entry = { tree: parseFormula(formula), precedents: null };
+        } catch {
+            entry = { tree: null, precedents: null };
+        }
+        if (formulaCache.size >= FORMULA_CACHE_LIMIT) formulaCache.clear();
+        formulaCache.set(formula, entry);
+    }
+    return entry;
+};
+
+const checkFinite = (num) => {
+    if (!Number.isFinite(num)) throw new Error(ERROR);
+    return num;
+};
+
+// Numeric value of a referenced cell: blanks and text count as 0, errors
+// propagate.
+const refValue = (val, getCellValue, bounds) => {
+    if (typeof val === 'number') return checkFinite(val);
+    if (val === ERROR) throw new Error(ERROR);
+    if (isFormula(val)) return refValue(evaluateFormula(val.slice(1), getCellValue, bounds), getCellValue, bounds);
+    if (val === undefined || val === null || val === '') return 0;
+    const num = Number(val);
+    return Number.isNaN(num) ? 0 : checkFinite(num);
+};
+
+// SUM/AVG/COUNT in a single pass over the rectangle: no intermediate array of
+// values and no chained map/filter/reduce per aggregate. Cells outside the
+// grid read as '' and add nothing, so with `bounds` ({ rows, cols }) the walk
+// stops at the grid's edge however far the range reaches past it.
+const aggregate = (node, getCellValue, bounds) => {
+    const { name, range } = node;
+    if (!range) return 0;
+    const maxRow = bounds ? Math.min(range.maxRow, bounds.rows - 1) : range.maxRow;
+    const maxCol = bounds ? Math.min(range.maxCol, bounds.cols - 1) : range.maxCol;
+    let sum = 0;
+    let numeric = 0;
+    let filled = 0;
+    for (let r = range.minRow; r <= maxRow; r++) {
+        for (let c = range.minCol; c <= maxCol; c++) {
+            const v = getCellValue(r, c);
+            if (v === undefined || v === null || v === '') continue;
+            filled++;
+            // Formula results are already numbers; only literals need parsing
+            const num = typeof v === 'number' ? v : parseFloat(v);
+            if (!Number.isNaN(num)) {
+                sum += num;
+                numeric++;
+            }
+        }
+    }
+    if (name === 'SUM') return sum;
+    if (name === 'AVG') return numeric ? sum / numeric : 0;
+    return filled;
+};
+
+const evalNode = (node, getCellValue, bounds) => {
+    switch (node.type) {
+        case 'num':
+            return node.value;
+        case 'ref':
+            return refValue(getCellValue(node.row, node.col), getCellValue, bounds);
+        case 'fn':
+            return checkFinite(aggregate(node, getCellValue, bounds));
+        case 'neg':
+            return -evalNode(node.arg, getCellValue, bounds);
+        case 'bin':
+            return OPS[node.op](evalNode(node.left, getCellValue, bounds), evalNode(node.right, getCellValue, bounds));
+        default:
+            throw new Error(`Unknown node: ${node.type}`);
+    }
+};
+
+export const evaluateFormula = (formula, getCellValue, bounds) => {
+    const { tree } = getFormulaEntry(formula);
+    if (!tree) return ERROR;
+    try {
+        // A non-finite result is an error here too, not only where another
+        // cell reads it
+        return checkFinite(evalNode(tree, getCellValue, bounds));
+    } catch {
+        return ERROR;
+    }
+};
+
+// Dependency tracking. The index maps every referenced cell to the formula
+// cells that read it, so an edit re-evaluates only its dependents instead of
+// every formula in the grid. Ranges are kept as rectangles per formula and
+// matched with a bounding-box check rather than expanded cell by cell.
+// Cells are keyed by a single integer, so lookups don't build or split
+// "row-col" strings.
+const cellKey = (row, col) => row * KEY_STRIDE + col;
+
+const parseCellKey = (key) => ({ row: Math.floor(key / KEY_STRIDE), col: key % KEY_STRIDE });
+
+// Formula cells read the computed value of the cells they reference; a cell
+// without `display` yet falls back to its raw value.
+const readDisplay = (gridData, row, col) => {
+    const cell = gridData[row]?.[col];
+    return cell?.display ?? (cell?.value || '');
+};
+
+const collectPrecedents = (node, cells, ranges) => {
+    switch (node.type) {
+        case 'ref':
+            cells.add(cellKey(node.row, node.col));
+            break;
+        case 'fn':
+            if (node.range) ranges.push(node.range);
+            break;
+        case 'neg':
+            collectPrecedents(node.arg, cells, ranges);
+            break;
+        case 'bin':
+            collectPrecedents(node.left, cells, ranges);
+            collectPrecedents(node.right, cells, ranges);
+            break;
+        default:
+    }
+};
+
+// Precedents are read off the cached parse tree, so each formula is scanned
+// once for evaluation and dependency tracking alike. A formula that doesn't
+// parse is always #ERR and depends on nothing.
+export const getPrecedents = (formula) => {
+    const entry = getFormulaEntry(formula);
+    if (!entry.precedents) {
+        const cells = new Set();
+        const ranges = [];
+        if (entry.tree) collectPrecedents(entry.tree, cells, ranges);
+        entry.precedents = Object.freeze({ cells: [...cells].map(parseCellKey), ranges });
+    }
+    return entry.precedents;
+};
+
+// Range owners are also filed under every block of RANGE_BUCKET_ROWS rows
+// their rectangles touch, so finding the ranges that contain a cell only
+// checks formulas whose ranges reach that cell's rows. A rectangle spanning
+// more than MAX_RANGE_BUCKETS blocks goes in the WIDE_RANGES bucket instead,
+// which every lookup checks, so a huge range can't flood the index.
+const RANGE_BUCKET_ROWS = 32;
+const MAX_RANGE_BUCKETS = 1024;
+const WIDE_RANGES = -1;
+
+const rowBucket = (row) => Math.floor(row / RANGE_BUCKET_ROWS);
+
+const forEachRangeBucket = (rects, fn) => {
+    const seen = new Set();
+    const visit = (b) => {
+        if (!seen.has(b)) {
+            seen.add(b);
+            fn(b);
+        }
+    };
+    rects.forEach(rect => {
+        const first = rowBucket(rect.minRow);
+        const last = rowBucket(rect.maxRow);
+        if (last - first >= MAX_RANGE_BUCKETS) {
+            visit(WIDE_RANGES);
+            return;
+        }
+        for (let b = first; b <= last; b++) visit(b);
+    });
+};
+
+export const createDependencyIndex = () => ({
+    dependents: new Map(),   // cell key -> Set of formula cell keys that reference it
+    ranges: new Map(),       // formula cell key -> rectangles it aggregates over
+    rangeBuckets: new Map(), // row bucket -> Set of formula cell keys with a range in it
+    precedents: new Map()    // formula cell key -> result of getPrecedents
+});
+
+// Replaces whatever the cell at (row, col) previously depended on with the
+// references in `value`. Safe to call repeatedly with the same arguments.
+export const setCellDependencies = (index, row, col, value) => {
+    const cellId = cellKey(row, col);
+    const previous = index.precedents.get(cellId);
+    if (previous) {
+        previous.cells.forEach(({ row: r, col: c }) => {
+            const ref = cellKey(r, c);
+            const deps = index.dependents.get(ref);
+            deps.delete(cellId);
+            if (deps.size === 0) index.dependents.delete(ref);
+        });
+        forEachRangeBucket(previous.ranges, b => {
+            const owners = index.rangeBuckets.get(b);
+            owners.delete(cellId);
+            if (owners.size === 0) index.rangeBuckets.delete(b);
+        });
+        index.ranges.delete(cellId);
+        index.precedents.delete(cellId);
+    }
+    if (!isFormula(value)) return;
+
+    const precedents = getPrecedents(value.slice(1));
+    index.precedents.set(cellId, precedents);
+    precedents.cells.forEach(({ row: r, col: c }) => {
+        const ref = cellKey(r, c);
+        let deps = index.dependents.get(ref);
+        if (!deps) index.dependents.set(ref, (deps = new Set()));
+        deps.add(cellId);
+    });
+    if (precedents.ranges.length) {
+        index.ranges.set(cellId, precedents.ranges);
+        forEachRangeBucket(precedents.ranges, b => {
+            let owners = index.rangeBuckets.get(b);
+            if (!owners) index.rangeBuckets.set(b, (owners = new Set()));
+            owners.add(cellId);
+        });
+    }
+};
+
+export const buildDependencyIndex = (gridData) => {
+    const index = createDependencyIndex();
+    gridData.forEach((row, r) => row.forEach((cell, c) => {
+        if (isFormula(cell?.value)) setCellDependencies(index, r, c, cell.value);
+    }));
+    return index;
+};
+
+export const getDependents = (index, row, col) => {
+    const result = new Set(index.dependents.get(cellKey(row, col)));
+    const checkOwner = (owner) => {
+        if (index.ranges.get(owner).some(rect =>
+            row >= rect.minRow && row <= rect.maxRow &&
+            col >= rect.minCol && col <= rect.maxCol
+        )) {
+            result.add(owner);
+        }
+    };
+    index.rangeBuckets.get(rowBucket(row))?.forEach(checkOwner);
+    index.rangeBuckets.get(WIDE_RANGES)?.forEach(checkOwner);
+    return result;
+};
+
+// The dependency index already records which cells hold formulas, so the
+// recalculation paths ask it instead of re-inspecting each cell's text.
+const computeDisplay = (gridData, bounds, value, formula) => (
+    formula
+        ? evaluateFormula(value.slice(1), (r, c) => readDisplay(gridData, r, c), bounds)
+        : value
+);
+
+const gridBounds = (gridData) => ({
+    rows: gridData.length,
+    cols: gridData.reduce((max, row) => Math.max(max, row.length), 0)
+});
+
+// Kahn's algorithm over the subgraph induced by `cellIds`. Cells caught in a
+// reference cycle never reach indegree 0 and are returned separately.
+// `known` holds dependents already looked up by the caller, so they aren't
+// queried from the index a second time.
+const topologicalOrder = (index, cellIds, known = new Map()) => {
+    const indegree = new Map(cellIds.map(id => [id, 0]));
+    const edges = new Map();
+    cellIds.forEach(id => {
+        let deps = known.get(id);
+        if (!deps) {
+            const { row, col } = parseCellKey(id);
+            deps = getDependents(index, row, col);
+        }
+        const next = [...deps].filter(dep => indegree.has(dep));
+        edges.set(id, next);
+        next.forEach(dep => indegree.set(dep, indegree.get(dep) + 1));
+    });
+
+    const order = cellIds.filter(id => indegree.get(id) === 0);
+    for (let i = 0; i < order.length; i++) {
+        edges.get(order[i]).forEach(dep => {
+            const remaining = indegree.get(dep) - 1;
+            indegree.set(dep, remaining);
+            if (remaining === 0) order.push(dep);
+        });
+    }
+    return { order, cyclic: cellIds.filter(id => indegree.get(id) > 0), edges };
+};
+
+// Walks `cellIds` once, precedents before dependents. Only the `changedIds`
+// and cells whose precedents produced a new value are evaluated, so a change
+// that doesn't alter a result stops propagating there. Cells in (or fed by) a
+// reference cycle can't be ordered and show #ERR. Rows are copied on write,
+// so `gridData` itself is left untouched.
+const evaluateCells = (gridData, index, cellIds, changedIds = cellIds, known) => {
+    const grid = gridData.slice();
+    const copiedRows = new Set();
+    const { order, cyclic, edges } = topologicalOrder(index, cellIds, known);
+    const stale = new Set([...changedIds, ...cyclic]);
+    const inCycle = new Set(cyclic);
+    const bounds = gridBounds(gridData);
+
+    [...order, ...cyclic].forEach(cellId => {
+        if (!stale.has(cellId)) return;
+        const { row, col } = parseCellKey(cellId);
+        const cell = grid[row]?.[col];
+        if (!cell) return;
+
+        const display = inCycle.has(cellId) ? ERROR : computeDisplay(grid, bounds, cell.value, index.precedents.has(cellId));
+        if (Object.is(display, cell.display)) return;
+
+        if (!copiedRows.has(row)) {
+            grid[row] = grid[row].slice();
+            copiedRows.add(row);
+        }
+        grid[row][col] = { ...cell, display };
+        edges.get(cellId).forEach(dep => stale.add(dep));
+    });
+    return grid;
+};
+
+// Fills in `display` for every formula cell; used after a full reload or a
+// structural change where any formula may be affected.
+export const computeDisplayValues = (gridData, index) => (
+    evaluateCells(gridData, index, [...index.precedents.keys()])
+);
+
+// Re-evaluates the changed cells and everything that transitively depends on
+// them: the affected set is collected once, then evaluated in dependency order
+// reusing the dependents found along the way.
+export const recalculate = (gridData, index, changedCells) => {
+    const changedIds = changedCells.map(({ row, col }) => cellKey(row, col));
+    const affected = new Set(changedIds);
+    const dependentsOf = new Map();
+    const queue = [...affected];
+    for (let i = 0; i < queue.length; i++) {
+        const { row, col } = parseCellKey(queue[i]);
+        const deps = getDependents(index, row, col);
+        dependentsOf.set(queue[i], deps);
+        deps.forEach(dep => {
+            if (!affected.has(dep)) {
+                affected.add(dep);
+                queue.push(dep);
+            }
+        });
+    }
+
+    // Typing a plain value into a cell no formula reads is the common case;
+    // it needs no ordering or evaluation, only its display refreshed
+    const literalOnly = affected.size === changedIds.length &&
+        changedIds.every(id => !index.precedents.has(id));
+    if (literalOnly) {
+        const grid = gridData.slice();
+        changedCells.forEach(({ row, col }) => {
+            const cell = grid[row]?.[col];
+            if (!cell) return;
+            grid[row] = grid[row].slice();
+            grid[row][col] = { ...cell, display: cell.value };
+        });
+        return grid;
+    }
+    return evaluateCells(gridData, index, [...affected], changedIds, dependentsOf);
+};
@@ -0,0 +1,202 @@
+import {
+  buildDependencyIndex,
+  cellRefToIndex,
+  columnLabel,
+  computeDisplayValues,
+  evaluateFormula,
+  getDependents,
+  getPrecedents,
+  recalculate,
+  setCellDependencies
+} from './formula';
+
+const sheet = (cells) => (row, col) => cells[`${row}-${col}`] ?? '';
+
+test('cellRefToIndex parses column letters and row numbers', () => {
+  expect(cellRefToIndex('A1')).toEqual({ row: 0, col: 0 });
+  expect(cellRefToIndex('AA10')).toEqual({ row: 9, col: 26 });
+  expect(cellRefToIndex('1A')).toBeNull();
+});
+
+test('columnLabel is the inverse of the column part of a ref', () => {
+  expect(columnLabel(0)).toBe('A');
+  expect(columnLabel(25)).toBe('Z');
+  expect(columnLabel(26)).toBe('AA');
+  expect(columnLabel(701)).toBe('ZZ');
+  expect(columnLabel(702)).toBe('AAA');
+  expect(cellRefToIndex(`${columnLabel(740)}1`).col).toBe(740);
+});
+
+test('evaluates arithmetic with precedence, parentheses and unary minus', () => {
+  const get = sheet({});
+  expect(evaluateFormula('1+2*3', get)).toBe(7);
+  expect(evaluateFormula('(1+2)*3', get)).toBe(9);
+  expect(evaluateFormula('-2*-3', get)).toBe(6);
+  expect(evaluateFormula('1/4', get)).toBe(0.25);
+});
+
+test('resolves cell refs, nested formulas and ranges', () => {
+  const get = sheet({ '0-0': '2', '1-0': '3', '2-0': '=A1*A2', '0-1': 'text' });
+  expect(evaluateFormula('A1+A2', get)).toBe(5);
+  expect(evaluateFormula('A3+1', get)).toBe(7);
+  expect(evaluateFormula('B1+1', get)).toBe(1);
+  expect(evaluateFormula('SUM(A1:A2)', get)).toBe(5);
+  expect(evaluateFormula('AVG(A1:A2)', get)).toBe(2.5);
+  expect(evaluateFormula('COUNT(A1:B1)', get)).toBe(2);
+  expect(evaluateFormula('sum(A1:A2) * 2', get)).toBe(10);
+  expect(evaluateFormula('a1 + sum(a1:a2)', get)).toBe(7);
+  expect(evaluateFormula('SUM(A1)', get)).toBe(0);
+});
+
+test('rejects anything that is not arithmetic', () => {
+  const get = sheet({});
+  expect(evaluateFormula('alert(1)', get)).toBe('#ERR');
+  expect(evaluateFormula('1+', get)).toBe('#ERR');
+  expect(evaluateFormula('(1', get)).toBe('#ERR');
+  expect(evaluateFormula('A1:A2', get)).toBe('#ERR');
+  expect(evaluateFormula('SUM()', get)).toBe('#ERR');
+});
+
+test('recalculate refreshes only the edited cell and its dependents', () => {
+  let grid = [
+    [{ value: '1' }, { value: '=A1*2' }, { value: '=SUM(A1:B1)' }],
+    [{ value: '5' }, { value: '=A2+1' }, { value: '' }]
+  ];
+  const index = buildDependencyIndex(grid);
+  grid = computeDisplayValues(grid, index);
+  expect(grid[0][2].display).toBe(3);
+
+  const untouched = grid[1];
+  grid = [grid[0].slice(), grid[1]];
+  grid[0][0] = { value: '4' };
+  setCellDependencies(index, 0, 0, '4');
+  grid = recalculate(grid, index, [{ row: 0, col: 0 }]);
+
+  expect(grid[0][1].display).toBe(8);
+  expect(grid[0][2].display).toBe(12);
+  expect(grid[1]).toBe(untouched);
+});
+
+test('diamond dependencies see fully updated precedents', () => {
+  const cells = [[{ value: '1' }, { value: '=A1*2' }, { value: '=A1+B1' }, { value: '=C1/0' }, { value: '=D1+1' }]];
+  const index = buildDependencyIndex(cells);
+  const grid = computeDisplayValues(cells, index);
+  expect(grid[0][2].display).toBe(3);
+  expect(grid[0][4].display).toBe('#ERR');
+});
+
+test('recalculate stops propagating once a value is unchanged', () => {
+  const index = buildDependencyIndex([[{ value: '2' }, { value: '=A1*0' }, { value: '=B1+1' }]]);
+  let grid = computeDisplayValues([[{ value: '2' }, { value: '=A1*0' }, { value: '=B1+1' }]], index);
+  const dependent = grid[0][2];
+
+  grid = [grid[0].slice()];
+  grid[0][0] = { value: '7' };
+  grid = recalculate(grid, index, [{ row: 0, col: 0 }]);
+
+  expect(grid[0][0].display).toBe('7');
+  expect(grid[0][2]).toBe(dependent);
+});
+
+test('a literal edit with no dependents only refreshes that cell', () => {
+  const cells = [[{ value: '1' }, { value: '=C1' }, { value: '' }]];
+  const index = buildDependencyIndex(cells);
+  let grid = computeDisplayValues(cells, index);
+  const formulaCell = grid[0][1];
+
+  grid = [grid[0].slice()];
+  grid[0][0] = { value: 'hello', display: 1 };
+  grid = recalculate(grid, index, [{ row: 0, col: 0 }]);
+
+  expect(grid[0][0].display).toBe('hello');
+  expect(grid[0][1]).toBe(formulaCell);
+});
+
+test('reference cycles evaluate to #ERR instead of recursing', () => {
+  const cells = [[{ value: '=B1+1' }, { value: '=A1+1' }, { value: '=B1*2' }, { value: '=A2' }], [{ value: '3' }]];
+  const index = buildDependencyIndex(cells);
+  const grid = computeDisplayValues(cells, index);
+  expect(grid[0][0].display).toBe('#ERR');
+  expect(grid[0][1].display).toBe('#ERR');
+  expect(grid[0][2].display).toBe('#ERR');
+  expect(grid[0][3].display).toBe(3);
+});
+
+test('getPrecedents reads refs and ranges from the parsed formula', () => {
+  expect(getPrecedents('SUM(A1:B2) + C3 * C3')).toEqual({
+    cells: [{ row: 2, col: 2 }],
+    ranges: [{ minRow: 0, maxRow: 1, minCol: 0, maxCol: 1 }]
+  });
+  expect(getPrecedents('A1 +')).toEqual({ cells: [], ranges: [] });
+});
+
+test('recalculate applies a batch of edits in one pass', () => {
+  const cells = [[{ value: '1' }, { value: '' }, { value: '=A1+B1' }]];
+  const index = buildDependencyIndex(cells);
+  let grid = computeDisplayValues(cells, index);
+
+  grid = [grid[0].slice()];
+  grid[0][0] = { value: '10' };
+  grid[0][1] = { value: '=A1*2' };
+  setCellDependencies(index, 0, 1, '=A1*2');
+  grid = recalculate(grid, index, [{ row: 0, col: 0 }, { row: 0, col: 1 }]);
+
+  expect(grid[0][1].display).toBe(20);
+  expect(grid[0][2].display).toBe(30);
+});
+
+test('getDependents finds range owners by row and forgets replaced ranges', () => {
+  const cells = [[{ value: '=SUM(B40:C41)' }, { value: '=COUNT(A1:A2)' }]];
+  const index = buildDependencyIndex(cells);
+  expect([...getDependents(index, 40, 2)]).toEqual([0]);
+  expect(getDependents(index, 40, 3).size).toBe(0);
+  expect([...getDependents(index, 1, 0)]).toEqual([1]);
+
+  setCellDependencies(index, 0, 0, '=B1');
+  expect(getDependents(index, 40, 2).size).toBe(0);
+  expect(index.rangeBuckets.size).toBe(1);
+
+  setCellDependencies(index, 0, 0, '=SUM(C1:C4000000000)');
+  expect(index.rangeBuckets.size).toBe(2);
+  expect([...getDependents(index, 3999999999, 2)]).toEqual([0]);
+  expect(getDependents(index, 3999999999, 1).size).toBe(0);
+});
+
+test('refs whose dependency key would alias another cell are rejected', () => {
+  expect(cellRefToIndex('BGQCW1').col).toBe(1048576);
+  const get = sheet({ '1-0': '5' });
+  expect(evaluateFormula('BGQCV1', get)).toBe(0);
+  expect(evaluateFormula('BGQCW1', get)).toBe('#ERR');
+  expect(evaluateFormula('B0', get)).toBe('#ERR');
+  expect(getPrecedents('B0 + A1')).toEqual({ cells: [], ranges: [] });
+
+  const cells = [[{ value: '1' }], [{ value: '=BGQCW1+A1' }]];
+  const index = buildDependencyIndex(cells);
+  const grid = computeDisplayValues(cells, index);
+  expect(getDependents(index, 1, 0).size).toBe(0);
+  expect(grid[1][0].display).toBe('#ERR');
+});
+
+test('range aggregates only walk the part of the range inside the grid', () => {
+  const cells = [
+    [{ value: '=SUM(A2:ZZ4000000)' }, { value: '=COUNT(A2:ZZ4000000)' }, { value: '=AVG(A2:A4000000)' }],
+    [{ value: '2' }, { value: 'x' }, { value: '' }],
+    [{ value: '3' }, { value: '' }, { value: '' }]
+  ];
+  const grid = computeDisplayValues(cells, buildDependencyIndex(cells));
+  expect(grid[0][0].display).toBe(5);
+  expect(grid[0][1].display).toBe(3);
+  expect(grid[0][2].display).toBe(2.5);
+});
+
+test('non-finite results show #ERR like the cells that read them', () => {
+  const get = sheet({});
+  expect(evaluateFormula('1/0', get)).toBe('#ERR');
+  expect(evaluateFormula('A1/0', get)).toBe('#ERR');
+  expect(evaluateFormula('-1/0', get)).toBe('#ERR');
+
+  const cells = [[{ value: '=A2/0' }, { value: '=A1+1' }]];
+  const grid = computeDisplayValues(cells, buildDependencyIndex(cells));
+  expect(grid[0][0].display).toBe('#ERR');
+  expect(grid[0][1].display).toBe('#ERR');
+});